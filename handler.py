@@ -4,7 +4,7 @@ RunPod serverless worker for Marker PDF conversion.
 Input schema (job["input"]):
     pdf             - Required. Base64-encoded PDF/image bytes, or a URL to download the file from.
     filename        - Optional. Original filename (used for extension detection). Defaults to "document.pdf".
-    page_range      - Optional. Page range string, e.g. "0-5". Defaults to all pages.
+    page_range      - Optional. Page range string, e.g. "0-5" or "0,2,4-6". Defaults to all pages.
     force_ocr       - Optional. Force OCR even if text layer exists. Defaults to False.
     paginate_output - Optional. Add page delimiters to output. Defaults to False.
     output_format   - Optional. One of: "markdown", "json", "html", "chunks". Defaults to "markdown".
@@ -16,6 +16,8 @@ Input schema (job["input"]):
                       constructor (e.g. {"ollama_model": "qwen3-vl:8b",
                       "ollama_base_url": "http://localhost:11434"}).
                       Only used when use_llm=True.
+    include_images  - Optional. Extract and return images. Defaults to True. When False,
+                      "images" is empty; without use_llm Marker also skips image extraction.
     action          - Optional. Control message for the worker lifecycle.
                       "stop_ollama": gracefully stop the background Ollama server.
                       When set, no PDF conversion is performed.
@@ -29,26 +31,40 @@ Output schema:
     json            - Structured JSON dict (when output_format="json").
     chunks          - Chunks text (when output_format="chunks").
     images          - Dict of image name -> base64-encoded PNG string
-                      (populated for non-JSON output formats; empty for output_format="json").
+                      (populated for non-JSON output formats; empty for output_format="json"
+                      or when include_images=False).
     metadata        - Marker metadata dict.
     page_count      - Number of pages processed.
 
 Environment variables:
     TORCH_DEVICE    - Device for inference ("cuda" or "cpu"). Defaults to "cuda".
     MODEL_CACHE_DIR - Directory where Marker/Surya models are downloaded and cached.
-                      Set this to a persistent volume mount path (e.g. /runpod-volume/models)
-                      so models survive container restarts. Defaults to /models (see Dockerfile).
+                      Defaults to /models, which is populated at image build time
+                      (see Dockerfile). Override with a persistent volume mount path
+                      (e.g. /runpod-volume/models) to keep the weights outside the image.
+    MAX_PDF_BYTES   - Largest accepted input file in bytes. Defaults to 209715200 (200 MiB).
+    RUNPOD_TMPFS    - RAM-backed directory used to stage input files. Defaults to /dev/shm.
+                      The default temp dir is used when it is missing, lacks room for the
+                      file plus a margin, or the file size is unknown, and as a retry if it
+                      fills up while the file is written.
+    GC_EVERY_N_JOBS - Run a full garbage collection after every N jobs. Defaults to 10.
 """
 
 import base64
+import errno
 import gc
+import importlib
 import io
 import json
 import logging
 import os
+import re
+import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import IO, Optional
 
 import requests
 import runpod
@@ -62,11 +78,41 @@ logger = logging.getLogger(__name__)
 
 # MODEL_CACHE_DIR is read directly from the environment by the surya/marker
 # pydantic-settings singleton at import time. Set it before importing marker.
-# Defaults to /models (see Dockerfile); override to a persistent volume path
-# (e.g. /runpod-volume/models) to avoid re-downloading models on cold starts.
+# Defaults to /models, where the Dockerfile bakes the weights into the image;
+# override to a persistent volume path (e.g. /runpod-volume/models) if needed.
 
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".tiff", ".bmp"}
 VALID_OUTPUT_FORMATS = {"markdown", "json", "html", "chunks"}
+DEFAULT_LLM_SERVICE = "marker.services.ollama.OllamaService"
+# Comma-separated page numbers or inclusive ranges, e.g. "0-5,8,10-12".
+# Whitespace around numbers is allowed, as Marker's parse_range_str accepts it.
+_PAGE_RANGE_RE = re.compile(r"\s*\d+\s*(-\s*\d+\s*)?(,\s*\d+\s*(-\s*\d+\s*)?)*")
+
+# Base64 input is decoded in slices of this many characters. Must be a
+# multiple of 4 so every slice decodes independently.
+B64_DECODE_CHUNK_CHARS = 4 * 64 * 1024
+# Pillow save options per output image format, tuned for encode speed.
+# PNG level 1 is several times faster than the default level 6 for a modest
+# size increase; WebP method 0 is the fastest lossless preset.
+IMAGE_SAVE_OPTIONS = {
+    "PNG": {"compress_level": 1, "optimize": False},
+    "WEBP": {"lossless": True, "method": 0},
+}
+# Buffer size used when copying a downloaded file to disk.
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# (connect, read) timeouts in seconds for URL downloads.
+DOWNLOAD_TIMEOUT = (10, 120)
+# Largest accepted input file, in bytes. Checked before anything is downloaded
+# or decoded.
+MAX_PDF_BYTES = int(os.environ.get("MAX_PDF_BYTES", str(200 * 1024 * 1024)))
+# Input files are staged on this tmpfs mount so they never touch disk. Falls
+# back to the default temp dir when it is missing or too small for the file.
+STAGING_DIR = os.environ.get("RUNPOD_TMPFS", "/dev/shm")
+# Minimum free space kept on STAGING_DIR beyond the expected file size; the
+# actual margin is the larger of this and a quarter of the file size.
+STAGING_MIN_HEADROOM = 16 * 1024 * 1024
+# Run a full gc.collect() once every N jobs rather than after every job.
+GC_EVERY_N_JOBS = max(1, int(os.environ.get("GC_EVERY_N_JOBS", "10")))
 
 # ---------------------------------------------------------------------------
 # Model loading – executed once when the container starts.
@@ -82,6 +128,14 @@ except Exception:
     logger.exception("Failed to load Marker models.")
     MODELS = None
 
+# Import the default LLM service module now so the first use_llm job does not
+# pay for it. Marker resolves service classes through sys.modules, and the
+# resolved classes are then held by the cached converters.
+try:
+    importlib.import_module(DEFAULT_LLM_SERVICE.rsplit(".", 1)[0])
+except Exception:
+    logger.exception("Failed to import default LLM service '%s'.", DEFAULT_LLM_SERVICE)
+
 # ---------------------------------------------------------------------------
 # OllamaRunner singleton – shared across all jobs (warm-start reuse).
 # ---------------------------------------------------------------------------
@@ -93,18 +147,175 @@ ollama_runner = OllamaRunner()
 # Helper utilities
 # ---------------------------------------------------------------------------
 
-def _resolve_file(pdf_input: str, filename: str) -> bytes:
-    """Return raw bytes from a base64 string or a URL."""
+_jobs_since_gc = 0
+
+
+def _maybe_collect_garbage() -> None:
+    """Force a full collection every *GC_EVERY_N_JOBS* jobs."""
+    global _jobs_since_gc
+    _jobs_since_gc += 1
+    if _jobs_since_gc >= GC_EVERY_N_JOBS:
+        _jobs_since_gc = 0
+        gc.collect()
+
+
+def _expected_size(pdf_input: str) -> Optional[int]:
+    """Return the size in bytes *pdf_input* will decode to, or ``None`` if unknown.
+
+    For URLs this issues a ``HEAD`` request and reads ``Content-Length``.
+    """
+    if pdf_input.startswith(("http://", "https://")):
+        try:
+            response = requests.head(pdf_input, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True)
+            response.raise_for_status()
+            return int(response.headers["Content-Length"])
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            return None
+    # Base64 encodes every 3 bytes as 4 characters.
+    return len(pdf_input) * 3 // 4
+
+
+def _staging_dir(expected_size: Optional[int]) -> Optional[str]:
+    """Return *STAGING_DIR* if it has room for *expected_size* bytes, else ``None``.
+
+    A margin is required on top of the estimate, which can be low (e.g. a
+    compressed ``Content-Length`` for a gzip download).
+    """
+    if expected_size is None:
+        return None
+    headroom = max(expected_size // 4, STAGING_MIN_HEADROOM)
+    try:
+        if shutil.disk_usage(STAGING_DIR).free > expected_size + headroom:
+            return STAGING_DIR
+    except OSError:
+        pass
+    return None
+
+
+def _stage_input(pdf_input: str, file_ext: str, expected_size: Optional[int]) -> IO[bytes]:
+    """Stream *pdf_input* into a temp file and return it, flushed and still open.
+
+    The file lives in :func:`_staging_dir` and is deleted when it is closed.
+    If the staging tmpfs fills up anyway, the input is staged again in the
+    default temp dir.
+    """
+    directory = _staging_dir(expected_size)
+    while True:
+        staged = tempfile.NamedTemporaryFile(suffix=file_ext, dir=directory)
+        try:
+            _resolve_file(pdf_input, staged)
+            staged.flush()
+            return staged
+        except OSError as exc:
+            staged.close()
+            if directory is None or exc.errno != errno.ENOSPC:
+                raise
+            logger.warning("%s is full; staging input in the default temp dir instead.", directory)
+            directory = None
+        except BaseException:
+            staged.close()
+            raise
+
+
+def _resolve_file(pdf_input: str, dest: IO[bytes]) -> None:
+    """Write the file behind a base64 string or a URL into *dest*.
+
+    The payload is streamed in bounded chunks so the full file is never held
+    in memory as a single ``bytes`` object.
+    """
     if pdf_input.startswith(("http://", "https://")):
         logger.info("Downloading file from URL: %s", pdf_input)
-        response = requests.get(pdf_input, timeout=120)
-        response.raise_for_status()
-        return response.content
+        with requests.get(pdf_input, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            # The HEAD check can be skipped by servers that do not answer it.
+            content_length = response.headers.get("Content-Length")
+            if content_length and int(content_length) > MAX_PDF_BYTES:
+                raise ValueError(
+                    f"File is {content_length} bytes; the limit is {MAX_PDF_BYTES} bytes."
+                )
+            # Let urllib3 undo any gzip/deflate Content-Encoding while copying.
+            response.raw.decode_content = True
+            # Count what is actually written: chunked or compressed responses
+            # can carry no Content-Length, or one smaller than the body.
+            written = 0
+            while chunk := response.raw.read(DOWNLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if written > MAX_PDF_BYTES:
+                    raise ValueError(f"File exceeds the {MAX_PDF_BYTES}-byte limit.")
+                dest.write(chunk)
+        return
     # Assume base64-encoded bytes
-    try:
-        return base64.b64decode(pdf_input, validate=True)
-    except Exception as exc:
-        raise ValueError(f"Invalid base64 input: {exc}") from exc
+    for start in range(0, len(pdf_input), B64_DECODE_CHUNK_CHARS):
+        chunk = pdf_input[start:start + B64_DECODE_CHUNK_CHARS]
+        try:
+            data = base64.b64decode(chunk, validate=True)
+        except ValueError as exc:  # binascii.Error, or non-ASCII input
+            raise ValueError(f"Invalid base64 input: {exc}") from exc
+        dest.write(data)
+
+def _encode_image(img_obj, image_format: str) -> str:
+    """Serialise a PIL image in *image_format* and return it base64-encoded."""
+    buf = io.BytesIO()
+    img_obj.save(buf, format=image_format, **IMAGE_SAVE_OPTIONS.get(image_format.upper(), {}))
+    # getbuffer() exposes the BytesIO contents without copying them.
+    return base64.b64encode(buf.getbuffer()).decode("ascii")
+
+
+def _encode_images(images: dict, image_format: str) -> dict:
+    """Encode all *images* concurrently; Pillow releases the GIL while compressing."""
+    if not images:
+        return {}
+    max_workers = min(len(images), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        encoded = pool.map(lambda img: _encode_image(img, image_format), images.values())
+        return dict(zip(images.keys(), encoded))
+
+
+@lru_cache(maxsize=4)
+def _get_converter(
+    output_format: str,
+    force_ocr: bool,
+    paginate_output: bool,
+    use_llm: bool,
+    llm_service_path: Optional[str],
+    llm_config_json: str,
+    include_images: bool,
+):
+    """Return a warm ``PdfConverter`` for a config shape, built on first use.
+
+    Parsing the config and building the converter (every processor plus the
+    LLM service) give the same result for every job with the same options,
+    so the converter is kept across jobs. The caller sets ``filepath`` and
+    ``page_range`` on ``converter.config`` before each conversion.
+    """
+    from marker.config.parser import ConfigParser
+    from marker.converters.pdf import PdfConverter
+
+    config = {
+        "force_ocr": force_ocr,
+        "paginate_output": paginate_output,
+        "output_format": output_format,
+        "use_llm": use_llm,
+        "llm_service": llm_service_path,
+        # With use_llm, Marker answers extract_images=False by describing every
+        # picture through the LLM, so only disable extraction without it.
+        "disable_image_extraction": not include_images and not use_llm,
+        **json.loads(llm_config_json),
+    }
+
+    config_parser = ConfigParser(config)
+    config_dict = config_parser.generate_config_dict()
+    config_dict["pdftext_workers"] = 1
+
+    return PdfConverter(
+        config=config_dict,
+        # PdfConverter stores its LLM service in artifact_dict; give each
+        # cached converter its own copy so they do not overwrite each other.
+        artifact_dict=dict(MODELS),
+        processor_list=config_parser.get_processors(),
+        renderer=config_parser.get_renderer(),
+        llm_service=config_parser.get_llm_service(),
+    )
 
 # ---------------------------------------------------------------------------
 # RunPod handler
@@ -140,9 +351,10 @@ def handler(job: dict) -> dict:
     use_llm: bool = bool(job_input.get("use_llm", False))
     llm_service_path: Optional[str] = job_input.get("llm_service")
     llm_config: Optional[dict] = job_input.get("llm_config",{})
+    include_images: bool = bool(job_input.get("include_images", True))
 
     if use_llm and not llm_service_path:
-        llm_service_path = "marker.services.ollama.OllamaService"
+        llm_service_path = DEFAULT_LLM_SERVICE
 
     if llm_config is not None and not isinstance(llm_config, dict):
         return {"success": False, "error": "'llm_config' must be a JSON object (dict)."}
@@ -155,6 +367,18 @@ def handler(job: dict) -> dict:
             "error": f"Unsupported file type '{file_ext}'. Allowed: {sorted(ALLOWED_EXTENSIONS)}",
         }
 
+    # --- validate page range ---
+    # An empty string means all pages, as Marker skips falsy config values.
+    if isinstance(page_range, str):
+        page_range = page_range.strip() or None
+    if page_range is not None and not (
+        isinstance(page_range, str) and _PAGE_RANGE_RE.fullmatch(page_range)
+    ):
+        return {
+            "success": False,
+            "error": f"Invalid page_range '{page_range}'. Expected e.g. \"0-5\" or \"0,2,4-6\".",
+        }
+
     # --- validate output format ---
     if output_format not in VALID_OUTPUT_FORMATS:
         return {
@@ -162,40 +386,27 @@ def handler(job: dict) -> dict:
             "error": f"Invalid output_format '{output_format}'. Must be one of: {sorted(VALID_OUTPUT_FORMATS)}",
         }
 
-    # --- resolve file bytes ---
-    try:
-        file_bytes = _resolve_file(pdf_input, filename)
-    except Exception as exc:
-        logger.exception("Failed to retrieve file.")
-        return {"success": False, "error": f"Failed to retrieve file: {exc}"}
+    # --- reject oversized input before downloading or decoding it ---
+    expected_size = _expected_size(pdf_input)
+    if expected_size is not None and expected_size > MAX_PDF_BYTES:
+        return {
+            "success": False,
+            "error": f"Payload too large: ~{expected_size} bytes exceeds the {MAX_PDF_BYTES}-byte limit.",
+        }
 
-    # --- write to a temp file and convert ---
-    # temp_path starts as None so the finally clause is safe even if the
-    # NamedTemporaryFile context manager raises before the assignment.
-    temp_path = None
+    # --- stream the file into a staging file and convert ---
+    # staged starts as None so the finally clause is safe even if opening
+    # the staging file raises.
+    staged = None
     try:
-        with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as tmp:
-            tmp.write(file_bytes)
-            temp_path = tmp.name
+        try:
+            staged = _stage_input(pdf_input, file_ext, expected_size)
+        except Exception as exc:
+            logger.exception("Failed to retrieve file.")
+            return {"success": False, "error": f"Failed to retrieve file: {exc}"}
 
-        from marker.config.parser import ConfigParser
-        from marker.converters.pdf import PdfConverter
         from marker.settings import settings
-
-        config = {
-            "filepath": temp_path,
-            "page_range": page_range,
-            "force_ocr": force_ocr,
-            "paginate_output": paginate_output,
-            "output_format": output_format,
-            "use_llm": use_llm,
-            "llm_service": llm_service_path,
-            **llm_config           
-        }
-
-        config_parser = ConfigParser(config)
-        config_dict = config_parser.generate_config_dict()
-        config_dict["pdftext_workers"] = 1
+        from marker.util import parse_range_str
 
         # --- lazy-start Ollama if needed ---
         if use_llm and llm_service_path and OllamaRunner.is_ollama_service(llm_service_path):
@@ -203,17 +414,24 @@ def handler(job: dict) -> dict:
             _model = (llm_config or {}).get("ollama_model")
             ollama_runner.ensure_ready(_base_url, _model)
 
-        converter = PdfConverter(
-            config=config_dict,
-            artifact_dict=MODELS,
-            processor_list=config_parser.get_processors(),
-            renderer=config_parser.get_renderer(),
-            llm_service=config_parser.get_llm_service(),
-            
+        converter = _get_converter(
+            output_format,
+            force_ocr,
+            paginate_output,
+            use_llm,
+            llm_service_path,
+            json.dumps(llm_config or {}, sort_keys=True),
+            include_images,
         )
+        # The converter is shared across jobs; only these fields vary per job.
+        converter.config["filepath"] = staged.name
+        if page_range:
+            converter.config["page_range"] = parse_range_str(page_range)
+        else:
+            converter.config.pop("page_range", None)
 
         logger.info("Converting '%s' to %s …", filename, output_format)
-        rendered_output = converter(temp_path)
+        rendered_output = converter(staged.name)
 
         # --- extract content ---
         json_content = None
@@ -223,7 +441,9 @@ def handler(job: dict) -> dict:
         encoded_images: dict = {}
 
         if output_format == "json":
-            json_content = rendered_output.model_dump()
+            # mode="json" emits JSON-ready primitives in one pydantic-core pass,
+            # so the response needs no further conversion before serialisation.
+            json_content = rendered_output.model_dump(mode="json")
         else:
             from marker.output import text_from_rendered
 
@@ -236,10 +456,8 @@ def handler(job: dict) -> dict:
             else:
                 markdown_content = text
 
-            for img_name, img_obj in images.items():
-                buf = io.BytesIO()
-                img_obj.save(buf, format=settings.OUTPUT_IMAGE_FORMAT)
-                encoded_images[img_name] = base64.b64encode(buf.getvalue()).decode("utf-8")
+            if include_images:
+                encoded_images = _encode_images(images, settings.OUTPUT_IMAGE_FORMAT)
 
         metadata = rendered_output.metadata
         logger.info("Conversion of '%s' completed successfully.", filename)
@@ -262,9 +480,9 @@ def handler(job: dict) -> dict:
         return {"success": False, "error": f"Conversion failed: {exc}"}
 
     finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
-        gc.collect()
+        if staged is not None:
+            staged.close()
+        _maybe_collect_garbage()
 
 
 if __name__ == "__main__":
@@ -9,13 +9,17 @@ Environment variables:
                            Defaults to 60.
 """
 
+import json
 import logging
 import os
+import shutil
 import signal
+import socket
 import subprocess
 import threading
 import time
 from typing import Optional
+from urllib.parse import urlsplit
 
 import requests
 
@@ -23,6 +27,10 @@ logger = logging.getLogger(__name__)
 
 OLLAMA_READY_TIMEOUT = int(os.environ.get("OLLAMA_READY_TIMEOUT", "60"))
 
+# Readiness polling backs off exponentially between these bounds (seconds).
+_READY_POLL_INITIAL = 0.1
+_READY_POLL_MAX = 2.0
+
 
 class OllamaRunner:
     """Manages a local ``ollama serve`` background process.
@@ -47,6 +55,8 @@ class OllamaRunner:
         self._stop_in_progress = False
         self._stop_requested = False
         self._last_start_error: Optional[Exception] = None
+        # Keep-alive session shared by all HTTP calls to the Ollama API.
+        self._session = requests.Session()
 
     # ------------------------------------------------------------------
     # Public API
@@ -92,10 +102,14 @@ class OllamaRunner:
         process: Optional[subprocess.Popen] = None
         try:
             logger.info("Starting ollama serve in background…")
+            # An absolute executable path and close_fds=False let CPython launch
+            # the server with posix_spawn() instead of fork()+exec(), avoiding
+            # the page-table copy of this (model-heavy) process.
             process = subprocess.Popen(
-                ["ollama", "serve"],
+                [shutil.which("ollama") or "ollama", "serve"],
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
+                close_fds=False,
             )
             logger.info("Ollama process started (pid %d).", process.pid)
 
@@ -120,7 +134,10 @@ class OllamaRunner:
     def pull_model(self, model: str, base_url: str = "http://localhost:11434") -> None:
         """Pull *model* if it is not already present in the local Ollama registry.
 
-        The pull is blocking so the model is fully available before the job proceeds.
+        Uses the ``POST /api/pull`` streaming endpoint over the runner's keep-alive
+        session. The pull is blocking so the model is fully available before the
+        job proceeds. The default model is baked into the image at build time (see
+        Dockerfile), so this only downloads models other than the default.
         """
         if not model:
             logger.warning("No ollama_model specified in llm_config; skipping pull.")
@@ -131,7 +148,31 @@ class OllamaRunner:
             return
 
         logger.info("Pulling model '%s' …", model)
-        subprocess.run(["ollama", "pull", model], check=True)
+        last_status = None
+        with self._session.post(
+            f"{base_url}/api/pull",
+            json={"model": model},
+            stream=True,
+            # The read timeout applies per socket read, not to the whole pull.
+            timeout=(10, 300),
+        ) as resp:
+            resp.raise_for_status()
+            # The endpoint streams one JSON progress object per line.
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                try:
+                    progress = json.loads(line)
+                except ValueError as exc:
+                    raise RuntimeError(f"Failed to pull model '{model}': {exc}") from exc
+                if progress.get("error"):
+                    raise RuntimeError(f"Failed to pull model '{model}': {progress['error']}")
+                last_status = progress.get("status")
+
+        if last_status != "success":
+            raise RuntimeError(
+                f"Pull of model '{model}' ended without success (last status: {last_status!r})."
+            )
         logger.info("Model '%s' ready.", model)
 
     def ensure_ready(
@@ -190,8 +231,19 @@ class OllamaRunner:
     # ------------------------------------------------------------------
 
     def _wait_until_ready(self, base_url: str, process: subprocess.Popen) -> None:
-        """Poll ``GET /api/tags`` until Ollama responds or *OLLAMA_READY_TIMEOUT* is exceeded."""
+        """Wait until Ollama responds or *OLLAMA_READY_TIMEOUT* is exceeded.
+
+        Each attempt first probes the TCP port, which is cheap, and only issues
+        ``GET /api/tags`` once the port accepts connections. The delay between
+        attempts grows from 0.1s to 2s so a fast start is detected quickly.
+        """
+        parts = urlsplit(base_url)
+        address = (
+            parts.hostname or "localhost",
+            parts.port or (443 if parts.scheme == "https" else 80),
+        )
         deadline = time.monotonic() + OLLAMA_READY_TIMEOUT
+        delay = _READY_POLL_INITIAL
         attempt = 0
         while time.monotonic() < deadline:
             attempt += 1
@@ -204,24 +256,25 @@ class OllamaRunner:
                 raise RuntimeError("Ollama process exited before becoming ready.")
 
             try:
-                resp = requests.get(f"{base_url}/api/tags", timeout=2)
+                socket.create_connection(address, timeout=0.2).close()
+                resp = self._session.get(f"{base_url}/api/tags", timeout=2)
                 if resp.status_code == 200:
                     logger.info("Ollama is ready (attempt %d).", attempt)
                     return
-            except requests.exceptions.RequestException:
+            except (OSError, requests.exceptions.RequestException):
                 pass
             logger.info("Waiting for Ollama to be ready… attempt %d", attempt)
-            time.sleep(2)
+            time.sleep(delay)
+            delay = min(delay * 2, _READY_POLL_MAX)
 
         raise RuntimeError(
             f"Ollama did not become ready within {OLLAMA_READY_TIMEOUT} seconds."
         )
 
-    @staticmethod
-    def _model_present(model: str, base_url: str) -> bool:
+    def _model_present(self, model: str, base_url: str) -> bool:
         """Return ``True`` if *model* is already in the local Ollama registry."""
         try:
-            resp = requests.get(f"{base_url}/api/tags", timeout=10)
+            resp = self._session.get(f"{base_url}/api/tags", timeout=10)
             resp.raise_for_status()
             models = resp.json().get("models", [])
             return any(m.get("name") == model for m in models)
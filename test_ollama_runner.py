@@ -0,0 +1,134 @@
+"""
+Unit tests for OllamaRunner readiness polling and model pulls.
+
+Run with:
+    python -m pytest test_ollama_runner.py -v
+
+No running Ollama server required — sockets, the HTTP session and sleeps are mocked.
+"""
+
+import importlib.util
+import json
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+
+# test_openai_service.py replaces sys.modules["ollama_runner"] with a stub, so
+# load the real module from its file under a private name.
+_spec = importlib.util.spec_from_file_location(
+    "_ollama_runner_under_test", Path(__file__).with_name("ollama_runner.py")
+)
+ollama_runner = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ollama_runner)
+
+
+def _pull_response(*lines):
+    resp = MagicMock()
+    resp.__enter__.return_value = resp
+    resp.iter_lines.return_value = [
+        line if isinstance(line, bytes) else json.dumps(line).encode() for line in lines
+    ]
+    return resp
+
+
+class TestPullModel(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = ollama_runner.OllamaRunner()
+        self.runner._session = MagicMock()
+        patcher = patch.object(self.runner, "_model_present", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _pull(self, *lines):
+        self.runner._session.post.return_value = _pull_response(*lines)
+        self.runner.pull_model("qwen3-vl:8b", "http://localhost:11434")
+
+    def test_success_stream(self):
+        self._pull({"status": "pulling manifest"}, b"", {"status": "success"})
+
+        args, kwargs = self.runner._session.post.call_args
+        self.assertEqual(args[0], "http://localhost:11434/api/pull")
+        self.assertEqual(kwargs["json"], {"model": "qwen3-vl:8b"})
+        self.assertTrue(kwargs["stream"])
+        self.assertIsNotNone(kwargs["timeout"][1])
+
+    def test_error_line_raises(self):
+        with self.assertRaisesRegex(RuntimeError, "file does not exist"):
+            self._pull({"status": "pulling manifest"}, {"error": "file does not exist"})
+
+    def test_stream_without_success_raises(self):
+        with self.assertRaisesRegex(RuntimeError, "without success"):
+            self._pull({"status": "pulling manifest"}, {"status": "downloading"})
+
+    def test_malformed_line_raises_runtime_error(self):
+        with self.assertRaisesRegex(RuntimeError, "Failed to pull model"):
+            self._pull({"status": "pulling manifest"}, b"{not json")
+
+    def test_present_model_is_not_pulled(self):
+        with patch.object(self.runner, "_model_present", return_value=True):
+            self.runner.pull_model("qwen3-vl:8b", "http://localhost:11434")
+        self.runner._session.post.assert_not_called()
+
+
+
+class TestWaitUntilReady(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = ollama_runner.OllamaRunner()
+        self.runner._session = MagicMock()
+        self.runner._session.get.return_value = MagicMock(status_code=200)
+        self.process = MagicMock()
+        self.process.poll.return_value = None
+
+        connect = patch.object(ollama_runner.socket, "create_connection")
+        sleep = patch.object(ollama_runner.time, "sleep")
+        self.mock_connect = connect.start()
+        self.mock_sleep = sleep.start()
+        self.addCleanup(connect.stop)
+        self.addCleanup(sleep.stop)
+
+    def test_probes_address_from_base_url(self):
+        cases = {
+            "http://localhost:11434": ("localhost", 11434),
+            "http://ollama.internal": ("ollama.internal", 80),
+            "https://ollama.internal": ("ollama.internal", 443),
+        }
+        for base_url, address in cases.items():
+            with self.subTest(base_url=base_url):
+                self.runner._wait_until_ready(base_url, self.process)
+                self.assertEqual(self.mock_connect.call_args.args[0], address)
+                self.runner._session.get.assert_called_with(f"{base_url}/api/tags", timeout=2)
+
+    def test_refused_connection_skips_http_and_backs_off(self):
+        refusals = 7
+        self.mock_connect.side_effect = [ConnectionRefusedError()] * refusals + [MagicMock()]
+
+        self.runner._wait_until_ready("http://localhost:11434", self.process)
+
+        self.assertEqual(self.runner._session.get.call_count, 1)
+        delays = [call.args[0] for call in self.mock_sleep.call_args_list]
+        self.assertEqual(delays, [0.1, 0.2, 0.4, 0.8, 1.6, 2.0, 2.0])
+
+    def test_http_error_is_retried(self):
+        self.runner._session.get.side_effect = [
+            ollama_runner.requests.exceptions.ConnectionError(),
+            MagicMock(status_code=200),
+        ]
+
+        self.runner._wait_until_ready("http://localhost:11434", self.process)
+
+        self.assertEqual(self.runner._session.get.call_count, 2)
+        self.mock_sleep.assert_called_once_with(0.1)
+
+    def test_dead_process_raises(self):
+        self.process.poll.return_value = 1
+
+        with self.assertRaisesRegex(RuntimeError, "exited before becoming ready"):
+            self.runner._wait_until_ready("http://localhost:11434", self.process)
+        self.mock_connect.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
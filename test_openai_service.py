@@ -8,8 +8,13 @@ No GPU or running backend required — the OpenAI client and Marker model
 loading are mocked.
 """
 
+import base64
+import errno
+import io
 import json
+import os
 import sys
+import tempfile
 import types
 import unittest
 from unittest.mock import MagicMock, patch
@@ -205,6 +210,9 @@ class TestCallExtraBody(unittest.TestCase):
 
 class TestHandlerRouting(unittest.TestCase):
 
+    def setUp(self):
+        _handler_mod._get_converter.cache_clear()
+
     def _run(self, job_input: dict):
         return _handler_mod.handler({"input": job_input})
 
@@ -224,12 +232,15 @@ class TestHandlerRouting(unittest.TestCase):
         fake_parser.get_llm_service.return_value = None
 
         mock_http = MagicMock()
-        mock_http.content = b"%PDF-1.4 fake"
+        mock_http.__enter__.return_value = mock_http
+        mock_http.raw = io.BytesIO(b"%PDF-1.4 fake")
+        mock_http.headers = {"Content-Length": "13"}
         mock_http.raise_for_status = MagicMock()
 
         with patch("marker.config.parser.ConfigParser", return_value=fake_parser), \
              patch("marker.converters.pdf.PdfConverter", return_value=fake_converter), \
              patch("marker.output.text_from_rendered", return_value=("# Hello", {}, {})), \
+             patch("requests.head", return_value=mock_http), \
              patch("requests.get", return_value=mock_http):
 
             result = self._run({
@@ -264,5 +275,303 @@ class TestHandlerRouting(unittest.TestCase):
         self.assertIn("llm_config", result.get("error", ""))
 
 
+
+# ---------------------------------------------------------------------------
+# Tests: cached converter reuse
+# ---------------------------------------------------------------------------
+
+class TestConverterReuse(unittest.TestCase):
+
+    def setUp(self):
+        _handler_mod._get_converter.cache_clear()
+
+    def _run_jobs(self, *job_inputs):
+        """Run *job_inputs* through the handler and return the converter configs seen per call."""
+        fake_rendered = MagicMock()
+        fake_rendered.metadata = {"page_stats": [{}]}
+        fake_converter = MagicMock()
+        fake_converter.config = {}
+        seen = []
+
+        def _convert(path):
+            seen.append({"path": path, **fake_converter.config})
+            return fake_rendered
+
+        fake_converter.side_effect = _convert
+
+        fake_parser = MagicMock()
+        fake_parser.generate_config_dict.return_value = {}
+        fake_parser.get_processors.return_value = None
+        fake_parser.get_renderer.return_value = None
+        fake_parser.get_llm_service.return_value = None
+
+        with patch("marker.config.parser.ConfigParser", return_value=fake_parser) as mock_parser_cls, \
+             patch("marker.converters.pdf.PdfConverter", return_value=fake_converter) as mock_converter_cls, \
+             patch("marker.output.text_from_rendered", return_value=("# Hello", {}, {})):
+            results = [_handler_mod.handler({"input": job_input}) for job_input in job_inputs]
+
+        for result in results:
+            self.assertTrue(result.get("success"), msg=f"Handler returned failure: {result}")
+        return seen, mock_parser_cls, mock_converter_cls
+
+    def test_per_job_fields_overlaid_on_reused_converter(self):
+        seen, _, mock_converter_cls = self._run_jobs(
+            {"pdf": "dGVzdA==", "page_range": "0-2"},
+            {"pdf": "dGVzdA=="},
+        )
+
+        mock_converter_cls.assert_called_once()
+        first, second = seen
+        self.assertEqual(first["page_range"], [0, 1, 2])
+        self.assertEqual(first["filepath"], first["path"])
+        self.assertNotIn("page_range", second)
+        self.assertEqual(second["filepath"], second["path"])
+        self.assertNotEqual(first["filepath"], second["filepath"])
+
+    def test_page_range_whitespace_and_empty_accepted(self):
+        seen, _, _ = self._run_jobs(
+            {"pdf": "dGVzdA==", "page_range": "0, 2"},
+            {"pdf": "dGVzdA==", "page_range": "1 - 3"},
+            {"pdf": "dGVzdA==", "page_range": "  "},
+        )
+        self.assertEqual(seen[0]["page_range"], [0, 2])
+        self.assertEqual(seen[1]["page_range"], [1, 2, 3])
+        self.assertNotIn("page_range", seen[2])
+
+    def _converter_config(self, job_input: dict) -> dict:
+        """Run one job through the real ConfigParser and return the config given to PdfConverter."""
+        fake_rendered = MagicMock()
+        fake_rendered.metadata = {"page_stats": [{}]}
+        with patch("marker.converters.pdf.PdfConverter",
+                   return_value=MagicMock(return_value=fake_rendered)) as mock_converter_cls, \
+             patch("marker.output.text_from_rendered", return_value=("# Hello", {}, {})):
+            result = _handler_mod.handler({"input": {"pdf": "dGVzdA==", **job_input}})
+        self.assertTrue(result.get("success"), msg=f"Handler returned failure: {result}")
+        return mock_converter_cls.call_args.kwargs["config"]
+
+    def test_include_images_false_disables_extraction(self):
+        config = self._converter_config({"include_images": False})
+        self.assertIs(config.get("extract_images"), False)
+
+    def test_include_images_false_keeps_extraction_with_llm(self):
+        config = self._converter_config({"include_images": False, "use_llm": True})
+        self.assertNotIn("extract_images", config)
+
+
+# ---------------------------------------------------------------------------
+# Tests: chunked base64 decode into the staging file
+# ---------------------------------------------------------------------------
+
+class TestResolveFileBase64(unittest.TestCase):
+
+    def test_multi_chunk_payload_round_trips(self):
+        raw = os.urandom(_handler_mod.B64_DECODE_CHUNK_CHARS)  # encodes to ~1.33 chunks
+        encoded = base64.b64encode(raw).decode("ascii")
+        self.assertGreater(len(encoded), _handler_mod.B64_DECODE_CHUNK_CHARS)
+
+        dest = io.BytesIO()
+        _handler_mod._resolve_file(encoded, dest)
+        self.assertEqual(dest.getvalue(), raw)
+
+    def test_invalid_character_after_first_chunk_rejected(self):
+        encoded = base64.b64encode(os.urandom(_handler_mod.B64_DECODE_CHUNK_CHARS)).decode("ascii")
+        pos = _handler_mod.B64_DECODE_CHUNK_CHARS + 8
+        encoded = encoded[:pos] + "!" + encoded[pos + 1:]
+
+        with self.assertRaisesRegex(ValueError, "Invalid base64 input"):
+            _handler_mod._resolve_file(encoded, io.BytesIO())
+
+    def test_write_error_keeps_its_cause(self):
+        dest = MagicMock()
+        dest.write.side_effect = OSError(28, "No space left on device")
+
+        with self.assertRaises(OSError) as ctx:
+            _handler_mod._resolve_file("dGVzdA==", dest)
+        self.assertNotIsInstance(ctx.exception, ValueError)
+        self.assertEqual(ctx.exception.errno, 28)
+
+
+# ---------------------------------------------------------------------------
+# Tests: periodic garbage collection
+# ---------------------------------------------------------------------------
+
+class TestGarbageCollection(unittest.TestCase):
+
+    def test_collects_once_every_n_jobs(self):
+        with patch.object(_handler_mod, "GC_EVERY_N_JOBS", 3), \
+             patch.object(_handler_mod, "_jobs_since_gc", 0), \
+             patch("gc.collect") as mock_collect:
+            for _ in range(2):
+                _handler_mod._maybe_collect_garbage()
+            mock_collect.assert_not_called()
+
+            _handler_mod._maybe_collect_garbage()
+            mock_collect.assert_called_once_with()
+
+
+# ---------------------------------------------------------------------------
+# Tests: output image encoding
+# ---------------------------------------------------------------------------
+
+class TestEncodeImages(unittest.TestCase):
+
+    def _images(self):
+        from PIL import Image
+
+        return {
+            f"_page_{i}_Picture_0.png": Image.new("RGB", (8 + i, 8), color)
+            for i, color in enumerate(("red", "green", "blue", "white"))
+        }
+
+    def test_keys_and_decoded_images(self):
+        from PIL import Image
+
+        images = self._images()
+        for image_format in ("PNG", "JPEG", "WEBP"):
+            with self.subTest(image_format=image_format):
+                encoded = _handler_mod._encode_images(images, image_format)
+
+                self.assertEqual(list(encoded), list(images))
+                for name, value in encoded.items():
+                    decoded = Image.open(io.BytesIO(base64.b64decode(value)))
+                    self.assertEqual(decoded.format, image_format)
+                    self.assertEqual(decoded.size, images[name].size)
+
+    def test_png_saved_with_fast_compression(self):
+        from PIL import Image
+
+        with patch.object(Image.Image, "save", autospec=True, side_effect=Image.Image.save) as mock_save:
+            _handler_mod._encode_images(self._images(), "PNG")
+
+        self.assertEqual(mock_save.call_count, 4)
+        for call in mock_save.call_args_list:
+            self.assertEqual(call.kwargs["format"], "PNG")
+            self.assertEqual(call.kwargs["compress_level"], 1)
+            self.assertFalse(call.kwargs["optimize"])
+
+    def test_no_images(self):
+        self.assertEqual(_handler_mod._encode_images({}, "PNG"), {})
+
+
+# ---------------------------------------------------------------------------
+# Tests: input staging
+# ---------------------------------------------------------------------------
+
+class TestStaging(unittest.TestCase):
+
+    MiB = 1024 * 1024
+
+    def _free(self, free_bytes):
+        return patch("shutil.disk_usage", return_value=MagicMock(free=free_bytes))
+
+    def test_staging_dir_chosen_when_large_enough(self):
+        with self._free(100 * self.MiB):
+            self.assertEqual(_handler_mod._staging_dir(10 * self.MiB), _handler_mod.STAGING_DIR)
+
+    def test_staging_dir_needs_headroom(self):
+        # 63 MiB fits in 64 MiB free only without a margin.
+        with self._free(64 * self.MiB):
+            self.assertIsNone(_handler_mod._staging_dir(63 * self.MiB))
+
+    def test_staging_dir_falls_back_on_oserror(self):
+        with patch("shutil.disk_usage", side_effect=OSError("missing")):
+            self.assertIsNone(_handler_mod._staging_dir(1))
+
+    def test_staging_dir_falls_back_for_unknown_size(self):
+        with self._free(100 * self.MiB) as mock_usage:
+            self.assertIsNone(_handler_mod._staging_dir(None))
+        mock_usage.assert_not_called()
+
+    def test_stage_input_retries_in_default_dir_when_tmpfs_fills(self):
+        with tempfile.TemporaryDirectory() as tmpfs, \
+             patch.object(_handler_mod, "STAGING_DIR", tmpfs), \
+             self._free(100 * self.MiB):
+            calls = []
+
+            def _resolve(pdf_input, dest):
+                calls.append(os.path.dirname(dest.name))
+                if len(calls) == 1:
+                    raise OSError(errno.ENOSPC, "No space left on device")
+                dest.write(b"data")
+
+            with patch.object(_handler_mod, "_resolve_file", side_effect=_resolve):
+                staged = _handler_mod._stage_input("dGVzdA==", ".pdf", 4)
+            try:
+                self.assertEqual(calls, [tmpfs, tempfile.gettempdir()])
+                self.assertEqual(os.listdir(tmpfs), [])
+            finally:
+                staged.close()
+
+    def test_staged_file_removed_after_handler_returns(self):
+        fake_rendered = MagicMock()
+        fake_rendered.metadata = {"page_stats": [{}]}
+        paths = []
+
+        def _convert(path):
+            self.assertTrue(os.path.exists(path))
+            paths.append(path)
+            return fake_rendered
+
+        _handler_mod._get_converter.cache_clear()
+        self.addCleanup(_handler_mod._get_converter.cache_clear)
+        fake_converter = MagicMock(side_effect=_convert)
+        fake_converter.config = {}
+        with patch("marker.converters.pdf.PdfConverter", return_value=fake_converter), \
+             patch("marker.output.text_from_rendered", return_value=("# Hello", {}, {})):
+            result = _handler_mod.handler({"input": {"pdf": "dGVzdA=="}})
+
+        self.assertTrue(result.get("success"), msg=f"Handler returned failure: {result}")
+        self.assertEqual(len(paths), 1)
+        self.assertFalse(os.path.exists(paths[0]))
+
+
+# ---------------------------------------------------------------------------
+# Tests: handler input validation
+# ---------------------------------------------------------------------------
+
+class TestHandlerValidation(unittest.TestCase):
+
+    def _run(self, job_input: dict):
+        return _handler_mod.handler({"input": job_input})
+
+    def test_rejects_oversized_base64_payload(self):
+        with patch.object(_handler_mod, "MAX_PDF_BYTES", 3):
+            result = self._run({"pdf": "dGVzdA==", "filename": "test.pdf"})
+        self.assertFalse(result.get("success"))
+        self.assertIn("too large", result.get("error", ""))
+
+    def test_rejects_url_with_oversized_content_length(self):
+        head = MagicMock()
+        head.headers = {"Content-Length": str(10 * 1024)}
+        with patch.object(_handler_mod, "MAX_PDF_BYTES", 1024), \
+             patch("requests.head", return_value=head), \
+             patch("requests.get") as mock_get:
+            result = self._run({"pdf": "https://example.com/big.pdf"})
+        self.assertFalse(result.get("success"))
+        self.assertIn("too large", result.get("error", ""))
+        mock_get.assert_not_called()
+
+    def test_rejects_download_over_limit_without_content_length(self):
+        head = MagicMock()
+        head.headers = {}
+        download = MagicMock()
+        download.__enter__.return_value = download
+        download.headers = {}
+        download.raw = io.BytesIO(b"x" * 2048)
+        with patch.object(_handler_mod, "MAX_PDF_BYTES", 1024), \
+             patch("requests.head", return_value=head), \
+             patch("requests.get", return_value=download):
+            result = self._run({"pdf": "https://example.com/chunked.pdf"})
+        self.assertFalse(result.get("success"))
+        self.assertIn("limit", result.get("error", ""))
+
+    def test_rejects_malformed_page_range(self):
+        for page_range in ("1-", "a-3", "1,,2", "1 2"):
+            with self.subTest(page_range=page_range):
+                result = self._run({"pdf": "dGVzdA==", "page_range": page_range})
+                self.assertFalse(result.get("success"))
+                self.assertIn("page_range", result.get("error", ""))
+
+
 if __name__ == "__main__":
     unittest.main()